@@ -1,7 +1,11 @@
 import logging
 import os
 
-import synapseclient
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
 
 from synapsegenie.example_filetype_format import FileTypeFormat
 from synapsegenie import process_functions
@@ -9,6 +13,59 @@ from synapsegenie import process_functions
 logger = logging.getLogger(__name__)
 
 
+def _arrow_writes_like_pandas(df, table):
+    """Checks that pyarrow's csv writer would write exactly what
+    DataFrame.to_csv writes.  It formats floats, bools and timestamps
+    differently, and pandas quotes a null in a one column frame, so only
+    frames with two or more integer or string columns are written with
+    pyarrow.  Values needing quotes make pyarrow raise instead.
+
+    Args:
+        df: Pandas dataframe
+        table: df as a pyarrow table
+
+    Returns:
+        bool: True if the output would be identical
+    """
+    if os.linesep != "\n" or len(df.columns) < 2:
+        return False
+    if any(char in str(col) for col in df.columns for char in '\t\r\n"'):
+        return False
+    return all(
+        pa.types.is_integer(field.type)
+        or pa.types.is_string(field.type)
+        or pa.types.is_large_string(field.type)
+        for field in table.schema
+    )
+
+
+def _write_tsv(df, path):
+    """Writes a dataframe as a tsv with pyarrow's csv writer when the
+    output would be identical to DataFrame.to_csv, falling back to pandas
+    otherwise.
+
+    Args:
+        df: Pandas dataframe
+        path: Path to write the tsv to
+    """
+    if pa is not None:
+        write_options = pacsv.WriteOptions(
+            delimiter="\t", include_header=False, quoting_style="none"
+        )
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if _arrow_writes_like_pandas(df, table):
+                # pyarrow always quotes the header, so write it separately
+                with open(path, "wb") as tsv:
+                    header = "\t".join(map(str, df.columns)) + "\n"
+                    tsv.write(header.encode())
+                    pacsv.write_csv(table, tsv, write_options=write_options)
+                return
+        except pa.ArrowException:
+            logger.debug("Writing %s with pandas", path)
+    df.to_csv(path, sep="\t", index=False)
+
+
 class Csv(FileTypeFormat):
 
     _filetype = "csv"
@@ -16,10 +73,10 @@ class Csv(FileTypeFormat):
     _process_kwargs = ["newPath", "databaseSynId"]
 
     def _validate_filetype(self, filePath):
-        assert os.path.basename(filePath).endswith(".csv")
+        assert filePath.endswith(".csv")
 
     def _process(self, df):
-        df.columns = [col.upper() for col in df.columns]
+        df.columns = df.columns.str.upper()
         return df
 
     def process_steps(self, df, newPath, databaseSynId):
@@ -29,12 +86,12 @@ class Csv(FileTypeFormat):
         #     syn=self.syn, databaseSynId=databaseSynId, newData=df,
         #     filterBy=self.center, toDelete=True
         # )
-        df.to_csv(newPath, sep="\t", index=False)
+        _write_tsv(df, newPath)
         return newPath
 
     def _validate(self, df):
         total_error = ""
         warning = ""
-        if df.empty:
-            total_error += "{}: File must not be empty".format(self._filetype)
+        if len(df) == 0:
+            total_error = f"{self._filetype}: File must not be empty"
         return total_error, warning
@@ -0,0 +1,68 @@
+"""Compiled kernels for row level validation checks.
+
+The kernels work on float64 numpy arrays (see
+FileTypeFormat._run_kernel) and return a tuple of the index of the first
+bad row (-1 if there is none) and the number of bad rows.  They are
+compiled with numba when it is installed and run as plain Python
+otherwise.
+"""
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
+
+def _jit(func):
+    """Compiles a kernel with numba if it is installed"""
+    if njit is None:
+        return func
+    return njit(cache=True, parallel=True)(func)
+
+
+@_jit
+def check_range(arr, lo, hi):
+    """Finds values outside of [lo, hi].  Missing values are skipped.
+
+    Args:
+        arr: float64 numpy array
+        lo: Lowest allowed value
+        hi: Highest allowed value
+
+    Returns:
+        tuple: Index of the first bad value and the number of bad values
+    """
+    n = arr.shape[0]
+    first = n
+    count = 0
+    for i in prange(n):
+        value = arr[i]
+        if value == value and (value < lo or value > hi):
+            first = min(first, i)
+            count += 1
+    if count == 0:
+        first = -1
+    return first, count
+
+
+@_jit
+def check_missing(arr):
+    """Finds missing values.
+
+    Args:
+        arr: float64 numpy array
+
+    Returns:
+        tuple: Index of the first missing value and the number of missing
+               values
+    """
+    n = arr.shape[0]
+    first = n
+    count = 0
+    for i in prange(n):
+        if arr[i] != arr[i]:
+            first = min(first, i)
+            count += 1
+    if count == 0:
+        first = -1
+    return first, count
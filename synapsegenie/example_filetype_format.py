@@ -1,10 +1,71 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import io
 import logging
+import mmap
 import os
+import re
+import threading
 
+import numpy as np
 import pandas as pd
 
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
 logger = logging.getLogger(__name__)
 
+# read_csv gained the pyarrow engine in pandas 1.4
+PYARROW_ENGINE = pyarrow is not None and tuple(
+    int(part) for part in pd.__version__.split(".")[:2]
+) >= (1, 4)
+
+COMMENT_LINES = re.compile(rb"^#.*(?:\n|\Z)", re.MULTILINE)
+
+# Blank lines before the header, which the C engine skips
+LEADING_BLANK_LINES = re.compile(rb"(?:[ \r]*\n)*")
+
+# Files larger than this are split into chunks that are parsed in
+# parallel when the C engine is used and the file type sets _chunked_read
+CHUNKED_READ_SIZE = 64 * 1024 * 1024
+
+# Files are read once for validation and again for processing, so the
+# most recently read dataframes are kept around, up to this many bytes in
+# total.  Entries are keyed by file type instance state, parsing settings,
+# path, modification time and size.
+DATAFRAME_CACHE_BYTES = 256 * 1024 * 1024
+_DATAFRAME_CACHE = OrderedDict()
+_DATAFRAME_CACHE_LOCK = threading.Lock()
+
+
+def _copy_on_write():
+    """Whether pandas copy-on-write is in effect, so that shallow copies
+    of a dataframe can't change each other"""
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    try:
+        return pd.get_option("mode.copy_on_write") is True
+    except KeyError:
+        return False
+
+
+def _hashable(value):
+    """Makes a read_csv setting usable in a cache key"""
+    if isinstance(value, dict):
+        return tuple((key, _hashable(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(item) for item in value)
+    return value
+
+
+def _available_cpus():
+    """Number of CPUs this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
 
 class FileTypeFormat:
 
@@ -14,38 +75,261 @@ class FileTypeFormat:
 
     _validation_kwargs = []
 
-    def __init__(self, syn, center):
+    # Column dtypes and the columns to read in.  Setting these for a file
+    # type with a known schema skips dtype inference when parsing.
+    _dtype_schema = None
+
+    _usecols = None
+
+    # Parse with the pyarrow engine when pyarrow and pandas 1.4+ are
+    # installed.  It is faster, but does not parse exactly like the C
+    # engine (dates are converted, short rows and duplicate headers raise
+    # or aren't renamed), so file types have to opt in.
+    _use_pyarrow = False
+
+    # Parse files larger than CHUNKED_READ_SIZE in parallel chunks on the
+    # C engine.  Malformed files and dtypes that differ between chunks
+    # fall back to a single parse, which then parses the file twice, and
+    # the speedup has not been measured yet, so file types have to opt in.
+    _chunked_read = False
+
+    # Read each file of a file list in parallel and concatenate their
+    # rows, rather than passing the list to _get_dataframe
+    _concat_files = False
+
+    def __init__(self, syn, center, poolSize=None):
         self.syn = syn
         self.center = center
+        self.poolSize = poolSize
 
     def _get_dataframe(self, filePath):
         '''
         This function by defaults assumes the filePathList is length of 1
-        and is a tsv file.  Could change depending on file type.
+        and is a tsv file.  Could change depending on file type, for
+        example to join the two clinical files.  Unless the file type sets
+        _concat_files, a list of files passed to read_file is passed on
+        here unchanged.
+
+        Args:
+            filePath:  A file path or a list of file paths (Max is 2 for
+                       the two clinical files)
+
+        Returns:
+            df: Pandas dataframe of file
+        '''
+        if not isinstance(filePath, (str, os.PathLike)):
+            if len(filePath) != 1:
+                raise ValueError(
+                    f"{self._filetype} expects one file, got {len(filePath)}"
+                )
+            filePath = filePath[0]
+        with open(filePath, "rb") as tsv:
+            if os.fstat(tsv.fileno()).st_size == 0:
+                # mmap cannot map an empty file, let pandas raise instead
+                return pd.read_csv(filePath, sep="\t")
+            with mmap.mmap(tsv.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                # The file is scanned front to back, so ask the kernel for
+                # aggressive readahead (Python 3.8+ on POSIX only)
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    buf.madvise(mmap.MADV_SEQUENTIAL)
+                data = None
+                comment = buf.find(b"#") != -1
+                # Quoted values can span lines, so a line starting with #
+                # may be inside a value.  Those files keep the C engine's
+                # comment handling.
+                if comment and buf.find(b'"') == -1:
+                    data = COMMENT_LINES.sub(b"", buf)
+                    comment = data.find(b"#") != -1
+                    if comment:
+                        data = None
+        # The mapping is closed before parsing so its pages don't add to
+        # the parser's memory use
+        df = self._read_tsv(filePath, data, comment)
+        return df
+
+    def _read_tsv(self, filePath, data=None, comment=False):
+        '''
+        Parses a tsv file.  Comment handling is only paid for when the
+        file actually contains a #: whole-line comments are stripped up
+        front and the C engine's comment handling is only used when
+        inline comments remain.  Files without comments are parsed
+        straight from disk.
 
         Args:
-            filePathList:  A list of file paths (Max is 2 for the two
-                           clinical files)
+            filePath: Path to file
+            data: Contents of the file with comment lines stripped, or
+                  None to parse the file itself
+            comment: Whether the C engine has to handle # comments
 
         Returns:
             df: Pandas dataframe of file
         '''
-        df = pd.read_csv(filePath, sep="\t", comment="#")
+        kwargs = {}
+        if self._dtype_schema is not None:
+            kwargs["dtype"] = self._dtype_schema
+        if self._usecols is not None:
+            kwargs["usecols"] = self._usecols
+        if comment:
+            kwargs["comment"] = "#"
+        # The pyarrow engine does not support comment
+        if self._use_pyarrow and PYARROW_ENGINE and not comment:
+            kwargs["engine"] = "pyarrow"
+        else:
+            size = os.path.getsize(filePath) if data is None else len(data)
+            if self._chunked_read and size > CHUNKED_READ_SIZE:
+                if data is None:
+                    with open(filePath, "rb") as tsv, mmap.mmap(
+                        tsv.fileno(), 0, access=mmap.ACCESS_READ
+                    ) as buf:
+                        df = self._read_buffer_chunks(buf, kwargs)
+                else:
+                    df = self._read_buffer_chunks(data, kwargs)
+                if df is not None:
+                    return df
+        source = filePath if data is None else io.BytesIO(data)
+        df = pd.read_csv(source, sep="\t", **kwargs)
+        return df
+
+    def _read_buffer_chunks(self, buf, kwargs):
+        '''
+        Parses a large tsv with the C engine by splitting it on line
+        boundaries and parsing the chunks in parallel.  The C tokenizer
+        releases the GIL, so the chunks are parsed on threads.  Each chunk
+        is given the header line so kwargs apply to it as they would to
+        the whole file.
+
+        Args:
+            buf: Bytes-like contents of the file
+            kwargs: read_csv keyword arguments
+
+        Returns:
+            df: Pandas dataframe of file, or None if the file can't be
+                split safely and has to be parsed in one go
+        '''
+        workers = _available_cpus()
+        # Quoted values can contain new lines, so line boundaries are
+        # only known to be row boundaries when there are no quotes
+        if workers == 1 or buf.find(b'"') != -1:
+            return None
+        header_start = LEADING_BLANK_LINES.match(buf).end()
+        header_end = buf.find(b"\n", header_start) + 1
+        if header_end == 0:
+            return None
+        header = buf[header_start:header_end]
+        step = (len(buf) - header_end) // workers + 1
+        offsets = [header_end]
+        while offsets[-1] < len(buf):
+            end = buf.find(b"\n", offsets[-1] + step)
+            offsets.append(len(buf) if end == -1 else end + 1)
+        # A chunk whose first row has more fields than the header would
+        # take them as its index, where a single parse raises an error
+        fields = header.count(b"\t")
+        for start in offsets[1:-1]:
+            end = buf.find(b"\n", start)
+            if buf[start:len(buf) if end == -1 else end].count(b"\t") > fields:
+                return None
+
+        def read_chunk(start, end):
+            chunk = io.BytesIO(header + buf[start:end])
+            return pd.read_csv(chunk, sep="\t", **kwargs)
+
+        try:
+            with ThreadPoolExecutor(workers) as executor:
+                dfs = list(
+                    executor.map(read_chunk, offsets[:-1], offsets[1:])
+                )
+        except ValueError:
+            # Parse errors are raised again by the single parse, with line
+            # numbers counted from the start of the file
+            return None
+        # Rows with an extra field (or an index column) turn into the index
+        # and would be dropped by the concat
+        if any(not isinstance(df.index, pd.RangeIndex) for df in dfs):
+            return None
+        if any(not df.columns.equals(dfs[0].columns) for df in dfs[1:]):
+            return None
+        # Chunks with different non-numeric dtypes for a column would
+        # concatenate into values that differ from a single parse
+        for col in dfs[0].columns:
+            dtypes = {df[col].dtype for df in dfs}
+            if len(dtypes) > 1 and not all(
+                pd.api.types.is_numeric_dtype(dtype)
+                and not pd.api.types.is_bool_dtype(dtype)
+                for dtype in dtypes
+            ):
+                return None
+        df = pd.concat(dfs, ignore_index=True)
         return df
 
     def read_file(self, filePath):
         '''
         Each file is to be read in for validation and processing.
-        This is not to be changed in any functions.
+        This is not to be changed in any functions.  A list of files is
+        passed to self._get_dataframe as is, unless the file type sets
+        _concat_files, in which case each file is read in parallel (up to
+        self.poolSize at a time) and the rows are concatenated.
+
+        Args:
+            filePath:  A file path or a list of file paths (Max is 2 for
+                       the two clinical files)
+
+        Returns:
+            df: Pandas dataframe of file
+        '''
+        if isinstance(filePath, (str, os.PathLike)):
+            return self._cached_get_dataframe(filePath)
+        if not self._concat_files:
+            return self._get_dataframe(filePath)
+        if len(filePath) == 1:
+            return self._cached_get_dataframe(filePath[0])
+        # Parsing releases the GIL, so threads are enough here and
+        # avoid having to pickle self.syn into worker processes
+        with ThreadPoolExecutor(self.poolSize or len(filePath)) as executor:
+            dfs = list(executor.map(self._cached_get_dataframe, filePath))
+        df = pd.concat(dfs, ignore_index=True)
+        return df
+
+    def _cached_get_dataframe(self, filePath):
+        '''
+        Calls self._get_dataframe, reusing the dataframe from an earlier
+        read of the same unmodified file.  Cached dataframes are handed out
+        as shallow copies, so caching is only done when pandas
+        copy-on-write keeps callers from changing the cached data.  Files
+        too big to fit in DATAFRAME_CACHE_BYTES are never cached.
 
         Args:
-            filePathList:  A list of file paths (Max is 2 for the two
-                           clinical files)
+            filePath: Path to file
 
         Returns:
             df: Pandas dataframe of file
         '''
+        if not _copy_on_write():
+            return self._get_dataframe(filePath)
+        stat = os.stat(filePath)
+        if stat.st_size > DATAFRAME_CACHE_BYTES:
+            return self._get_dataframe(filePath)
+        # The syn client is keyed by id so the cache doesn't keep it alive
+        key = (type(self), self.center, id(self.syn),
+               _hashable(self._dtype_schema), _hashable(self._usecols),
+               self._use_pyarrow, os.path.abspath(filePath),
+               stat.st_mtime_ns, stat.st_size)
+        with _DATAFRAME_CACHE_LOCK:
+            cached = _DATAFRAME_CACHE.get(key)
+            if cached is not None:
+                _DATAFRAME_CACHE.move_to_end(key)
+                return cached[0].copy(deep=False)
         df = self._get_dataframe(filePath)
+        # _get_dataframe may return a path instead of a dataframe
+        if not isinstance(df, pd.DataFrame):
+            return df
+        nbytes = df.memory_usage(index=True, deep=True).sum()
+        if nbytes <= DATAFRAME_CACHE_BYTES:
+            with _DATAFRAME_CACHE_LOCK:
+                _DATAFRAME_CACHE[key] = (df.copy(deep=False), nbytes)
+                total = sum(size for _, size in _DATAFRAME_CACHE.values())
+                while total > DATAFRAME_CACHE_BYTES:
+                    _, (_, size) = _DATAFRAME_CACHE.popitem(last=False)
+                    total -= size
         return df
 
     def _validate_filetype(self, filePath):
@@ -102,12 +386,11 @@ class FileTypeFormat:
         '''
         preprocess_args = self.preprocess(kwargs.get('newPath'))
         kwargs.update(preprocess_args)
-        mykwargs = {}
-        for required_parameter in self._process_kwargs:
-            assert required_parameter in kwargs.keys(), \
-                "%s not in parameter list" % required_parameter
-            mykwargs[required_parameter] = kwargs[required_parameter]
-        logger.info('PROCESSING %s' % filePath)
+        missing = set(self._process_kwargs) - kwargs.keys()
+        assert not missing, \
+            "%s not in parameter list" % ", ".join(sorted(missing))
+        mykwargs = {key: kwargs[key] for key in self._process_kwargs}
+        logger.info('PROCESSING %s', filePath)
         path_or_df = self.read_file(filePath)
         path = self.process_steps(path_or_df, **mykwargs)
         return path
@@ -127,38 +410,63 @@ class FileTypeFormat:
         '''
         errors = ""
         warnings = ""
-        logger.info(f"NO VALIDATION for {self._filetype} files")
+        logger.info("NO VALIDATION for %s files", self._filetype)
         return errors, warnings
 
+    def _run_kernel(self, df, col, kernel, *args):
+        '''
+        Runs one of the synapsegenie._validate_kernels checks over a
+        column, for use in self._validate.
+
+        Args:
+            df: A dataframe of the file
+            col: Column to check
+            kernel: A synapsegenie._validate_kernels function
+            args: Any other arguments to the kernel
+
+        Returns:
+            tuple: Index of the first bad row (-1 if there is none) and
+                   the number of bad rows
+        '''
+        arr = df[col].to_numpy(dtype="float64", na_value=np.nan)
+        return kernel(arr, *args)
+
     def validate(self, filePath, **kwargs):
         '''
         This is the main validation function.
         Every file type calls self._validate, which is different.
 
         Args:
-            filePath: A list of file paths.
+            filePath: A file path or a list of file paths.
             kwargs: The kwargs are determined by self._validation_kwargs
 
         Returns:
             tuple: The errors and warnings as a file from validation.
         '''
-        mykwargs = {}
-        for required_parameter in self._validation_kwargs:
-            if required_parameter not in kwargs.keys():
-                raise ValueError(f"Missing '{required_parameter}' parameter.")
-            mykwargs[required_parameter] = kwargs[required_parameter]
+        missing = set(self._validation_kwargs) - kwargs.keys()
+        if missing:
+            missing = ", ".join(f"'{key}'" for key in sorted(missing))
+            raise ValueError(f"Missing {missing} parameter.")
+        mykwargs = {key: kwargs[key] for key in self._validation_kwargs}
+
+        if isinstance(filePath, (str, os.PathLike)):
+            filePathList = [filePath]
+        else:
+            filePathList = list(filePath)
 
         errors = ""
 
         try:
             df = self.read_file(filePath)
         except Exception as e:
-            errors = (f"The file(s) ({filePath}) cannot be read. "
-                      f"Original error: {str(e)}")
+            errors = (f"The file(s) ({', '.join(map(str, filePathList))}) "
+                      f"cannot be read. Original error: {str(e)}")
             warnings = ""
 
         if not errors:
-            logger.info(f"VALIDATING {os.path.basename(filePath)}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("VALIDATING %s",
+                            ",".join(map(os.path.basename, filePathList)))
             errors, warnings = self._validate(df, **mykwargs)
         # File is valid if error string is blank
         valid = (errors == '')
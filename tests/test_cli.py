@@ -19,13 +19,14 @@ class ArgParser:
     filepath = "path.csv"
     format_registry_packages = ["example_registry"]
     project_id = "syn1234"
+    _databasetosynid_mappingdf = pd.DataFrame(
+        {"Database": ["centerMapping"],
+         "Id": ["syn123"],
+         "center": ["try"]}
+    )
 
     def asDataFrame(self):
-        database_dict = {"Database": ["centerMapping"],
-                         "Id": ["syn123"],
-                         "center": ["try"]}
-        databasetosynid_mappingdf = pd.DataFrame(database_dict)
-        return databasetosynid_mappingdf
+        return self._databasetosynid_mappingdf
 
 
 def test_perform_validate():
@@ -0,0 +1,324 @@
+"""Tests example_filetype_format.py"""
+from unittest import mock
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+import synapseclient
+
+from synapsegenie import example_filetype_format
+
+syn = mock.create_autospec(synapseclient.Synapse)
+FILE_FORMAT = example_filetype_format.FileTypeFormat(syn, "SAGE")
+EXPECTED_DF = pd.DataFrame({"foo": [1, 3], "bar": ["a", "b"]})
+
+
+@pytest.fixture(params=[True, False], ids=["pyarrow", "c"])
+def reader(request):
+    """Run the test with and without the pyarrow reader"""
+    if request.param:
+        if not example_filetype_format.PYARROW_ENGINE:
+            pytest.skip("pandas' pyarrow engine is not available")
+        with patch.object(FILE_FORMAT, "_use_pyarrow", True):
+            yield
+    else:
+        yield
+
+
+def test__get_dataframe(tmp_path, reader):
+    """Test reading in a tsv"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("foo\tbar\n1\ta\n3\tb\n")
+    df = FILE_FORMAT._get_dataframe(str(tsv))
+    pd.testing.assert_frame_equal(df, EXPECTED_DF, check_dtype=False)
+
+
+def test_comments__get_dataframe(tmp_path, reader):
+    """Test comment lines are dropped"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("#comment\nfoo\tbar\n1\ta\n#comment\n3\tb\n")
+    df = FILE_FORMAT._get_dataframe(str(tsv))
+    pd.testing.assert_frame_equal(df, EXPECTED_DF, check_dtype=False)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "foo\tbar\n2020-01-01\ta\n2020-01-02\tb\n",
+        "foo\tbar\n1\ta\n3\n",
+        "foo\tfoo\n1\ta\n3\tb\n",
+        "foo\tbar\n99999999999999999999\ta\n",
+        "foo\tbar\n",
+    ],
+    ids=["dates", "short_rows", "duplicate_headers", "big_ints",
+         "header_only"]
+)
+def test_matches_c_engine__get_dataframe(tmp_path, text):
+    """Test files are parsed just as pandas' C engine would by default"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text(text)
+    df = FILE_FORMAT._get_dataframe(str(tsv))
+    expected = pd.read_csv(str(tsv), sep="\t", comment="#")
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_quoted_comment__get_dataframe(tmp_path, reader):
+    """Test lines starting with # inside quoted values are kept"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text('a\tb\n"x\n#y"\t1\n')
+    df = FILE_FORMAT._get_dataframe(str(tsv))
+    expected = pd.read_csv(str(tsv), sep="\t", comment="#")
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_old_pandas__get_dataframe(tmp_path):
+    """Test the C engine is used when pandas has no pyarrow engine"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("foo\tbar\n1\ta\n3\tb\n")
+    with patch.object(example_filetype_format, "PYARROW_ENGINE", False),\
+         patch.object(FILE_FORMAT, "_use_pyarrow", True),\
+         patch.object(example_filetype_format.pd, "read_csv",
+                      wraps=pd.read_csv) as patch_read_csv:
+        FILE_FORMAT._get_dataframe(str(tsv))
+    assert "engine" not in patch_read_csv.call_args.kwargs
+
+
+def test_inline_comments__get_dataframe(tmp_path, reader):
+    """Test inline comments are dropped"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("foo\tbar\n1\ta#comment\n3\tb\n")
+    df = FILE_FORMAT._get_dataframe(str(tsv))
+    pd.testing.assert_frame_equal(df, EXPECTED_DF, check_dtype=False)
+
+
+def test_empty_file_validate(tmp_path, reader):
+    """Test an empty file is reported as unreadable"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("")
+    valid, errors, warnings = FILE_FORMAT.validate(str(tsv))
+    assert not valid
+    assert errors.startswith(f"The file(s) ({tsv}) cannot be read.")
+    assert warnings == ""
+
+
+def test_filelist_read_file(tmp_path):
+    """Test a list of files is read in and concatenated"""
+    first = tmp_path / "first.tsv"
+    first.write_text("foo\tbar\n1\ta\n")
+    second = tmp_path / "second.tsv"
+    second.write_text("foo\tbar\n3\tb\n")
+    with patch.object(FILE_FORMAT, "_concat_files", True):
+        df = FILE_FORMAT.read_file([str(first), str(second)])
+    pd.testing.assert_frame_equal(df, EXPECTED_DF, check_dtype=False)
+
+
+def test_filelist_passed_read_file():
+    """Test a list of files is passed as is to _get_dataframe"""
+    with patch.object(FILE_FORMAT, "_get_dataframe",
+                      return_value=EXPECTED_DF) as patch_get_df:
+        df = FILE_FORMAT.read_file(["patient.tsv", "sample.tsv"])
+        patch_get_df.assert_called_once_with(["patient.tsv", "sample.tsv"])
+    assert df is EXPECTED_DF
+
+
+def test_filelist__get_dataframe(tmp_path):
+    """Test the default _get_dataframe reads a list of one file"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("foo\tbar\n1\ta\n3\tb\n")
+    df = FILE_FORMAT._get_dataframe([str(tsv)])
+    pd.testing.assert_frame_equal(df, EXPECTED_DF, check_dtype=False)
+    with pytest.raises(ValueError, match="fileType expects one file, got 2"):
+        FILE_FORMAT._get_dataframe([str(tsv), str(tsv)])
+
+
+def test_path_validate(tmp_path):
+    """Test a pathlib.Path can be validated"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("foo\tbar\n1\ta\n")
+    assert FILE_FORMAT.validate(tsv) == (True, "", "")
+
+
+def test_missing_kwargs_process():
+    """Test missing process kwargs are caught"""
+    with pytest.raises(AssertionError,
+                       match="databaseSynId not in parameter list"):
+        FILE_FORMAT.process("foo.tsv", newPath="bar.tsv")
+
+
+def test_missing_kwargs_validate():
+    """Test missing validation kwargs are caught"""
+    with patch.object(FILE_FORMAT, "_validation_kwargs", ["foo", "bar"]),\
+         pytest.raises(ValueError, match="Missing 'bar', 'foo' parameter."):
+        FILE_FORMAT.validate("foo.tsv", baz="baz")
+
+
+def test_schema__get_dataframe(tmp_path, reader):
+    """Test the dtype schema and columns are used to read the file"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("foo\tbar\tbaz\n1\ta\tc\n3\tb\td\n")
+    with patch.object(FILE_FORMAT, "_dtype_schema", {"foo": "float64"}),\
+         patch.object(FILE_FORMAT, "_usecols", ["foo", "bar"]):
+        df = FILE_FORMAT._get_dataframe(str(tsv))
+    assert df.columns.tolist() == ["foo", "bar"]
+    assert df["foo"].dtype == "float64"
+
+
+@pytest.fixture
+def copy_on_write():
+    """Skip tests of the dataframe cache if pandas can't use it"""
+    if not example_filetype_format._copy_on_write():
+        pytest.skip("pandas copy-on-write is not enabled")
+
+
+def test_cached_read_file(tmp_path, copy_on_write):
+    """Test an unmodified file is only parsed once"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("foo\tbar\n1\ta\n3\tb\n")
+    with patch.object(FILE_FORMAT, "_get_dataframe",
+                      return_value=EXPECTED_DF.copy()) as patch_get_df:
+        first = FILE_FORMAT.read_file(str(tsv))
+        first.loc[0, "foo"] = 0
+        first.columns = ["FOO", "BAR"]
+        second = FILE_FORMAT.read_file(str(tsv))
+        patch_get_df.assert_called_once_with(str(tsv))
+    pd.testing.assert_frame_equal(second, EXPECTED_DF)
+
+
+def test_other_center_cached_read_file(tmp_path, copy_on_write):
+    """Test another center's file format doesn't share cached files"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("foo\tbar\n1\ta\n3\tb\n")
+    other = example_filetype_format.FileTypeFormat(syn, "OTHER")
+    with patch.object(example_filetype_format.FileTypeFormat,
+                      "_get_dataframe",
+                      return_value=EXPECTED_DF.copy()) as patch_get_df:
+        FILE_FORMAT.read_file(str(tsv))
+        other.read_file(str(tsv))
+        assert patch_get_df.call_count == 2
+
+
+def test_other_settings_cached_read_file(tmp_path, copy_on_write):
+    """Test files read with other parsing settings aren't shared"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("foo\tbar\n1\ta\n3\tb\n")
+    df = FILE_FORMAT.read_file(str(tsv))
+    assert df["foo"].dtype == "int64"
+    with patch.object(FILE_FORMAT, "_dtype_schema", {"foo": "float64"}):
+        df = FILE_FORMAT.read_file(str(tsv))
+    assert df["foo"].dtype == "float64"
+    with patch.object(FILE_FORMAT, "_usecols", ["bar"]):
+        df = FILE_FORMAT.read_file(str(tsv))
+    assert df.columns.tolist() == ["bar"]
+
+
+def test_large_file_read_file(tmp_path, copy_on_write):
+    """Test files too big for the cache are parsed every time"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("foo\tbar\n1\ta\n3\tb\n")
+    with patch.object(example_filetype_format, "DATAFRAME_CACHE_BYTES", 1),\
+         patch.object(FILE_FORMAT, "_get_dataframe",
+                      return_value=EXPECTED_DF.copy()) as patch_get_df:
+        FILE_FORMAT.read_file(str(tsv))
+        FILE_FORMAT.read_file(str(tsv))
+        assert patch_get_df.call_count == 2
+
+
+def test_modified_cached_read_file(tmp_path):
+    """Test a modified file is parsed again"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("foo\tbar\n1\ta\n")
+    FILE_FORMAT.read_file(str(tsv))
+    tsv.write_text("foo\tbar\n1\ta\n3\tb\n")
+    df = FILE_FORMAT.read_file(str(tsv))
+    pd.testing.assert_frame_equal(df, EXPECTED_DF, check_dtype=False)
+
+
+def test_filelist_validate(tmp_path, caplog):
+    """Test every file name is logged when validating a list of files"""
+    first = tmp_path / "first.tsv"
+    first.write_text("foo\tbar\n1\ta\n")
+    second = tmp_path / "second.tsv"
+    second.write_text("foo\tbar\n3\tb\n")
+    with caplog.at_level("INFO"),\
+         patch.object(FILE_FORMAT, "_concat_files", True):
+        valid, errors, warnings = FILE_FORMAT.validate(
+            [str(first), str(second)]
+        )
+    assert valid
+    assert "VALIDATING first.tsv,second.tsv" in caplog.text
+
+
+@pytest.fixture
+def chunked_reader():
+    """Split every file read by the C engine into chunks"""
+    with patch.object(FILE_FORMAT, "_chunked_read", True),\
+         patch.object(example_filetype_format, "CHUNKED_READ_SIZE", 0),\
+         patch.object(example_filetype_format, "_available_cpus",
+                      return_value=3):
+        yield
+
+
+def test_chunked__get_dataframe(tmp_path, chunked_reader):
+    """Test large files are read in chunks"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("foo\tbar\n1\ta\n\n3\tb\n#comment\n5\tc\n7\td\n")
+    with patch.object(example_filetype_format.FileTypeFormat,
+                      "_read_buffer_chunks",
+                      wraps=FILE_FORMAT._read_buffer_chunks) as patch_chunks:
+        df = FILE_FORMAT._get_dataframe(str(tsv))
+        patch_chunks.assert_called_once()
+    expected = pd.DataFrame({"foo": [1, 3, 5, 7], "bar": ["a", "b", "c", "d"]})
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+
+def test_leading_blank_lines_chunked__get_dataframe(tmp_path,
+                                                   chunked_reader):
+    """Test blank lines before the header are skipped when chunking"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("\n  \nfoo\tbar\n1\ta\n3\tb\n5\tc\n7\td\n")
+    df = FILE_FORMAT._get_dataframe(str(tsv))
+    expected = pd.read_csv(str(tsv), sep="\t")
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_mixed_dtypes_chunked__get_dataframe(tmp_path, chunked_reader):
+    """Test chunks that disagree on a column's dtype are read in one go"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("foo\tbar\n1\ta\n3\tb\nfoo\tc\n")
+    df = FILE_FORMAT._get_dataframe(str(tsv))
+    expected = pd.DataFrame({"foo": ["1", "3", "foo"], "bar": ["a", "b", "c"]})
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["a\tb\n1\t2\n3\t4\n5\t6\n7\t8\t9\n9\t10\n",
+     "a\tb\n1\t2\n3\t4\n5\t6\n7\t8\n9\t10\t11\n"],
+    ids=["extra_field_chunk_start", "extra_field_last_row"]
+)
+def test_extra_fields_chunked_validate(tmp_path, chunked_reader, text):
+    """Test rows with too many fields fail validation when chunking"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text(text)
+    valid, errors, warnings = FILE_FORMAT.validate(str(tsv))
+    assert not valid
+    assert "Expected 2 fields in line" in errors
+
+
+def test_index_column_chunked__get_dataframe(tmp_path, chunked_reader):
+    """Test an index column is kept when chunking"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("a\tb\nx\t1\t2\ny\t3\t4\nz\t5\t6\nw\t7\t8\n")
+    df = FILE_FORMAT._get_dataframe(str(tsv))
+    expected = pd.read_csv(str(tsv), sep="\t")
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_not_opted_in_chunked__get_dataframe(tmp_path):
+    """Test files are only chunked when the file type opts in"""
+    tsv = tmp_path / "test.tsv"
+    tsv.write_text("foo\tbar\n1\ta\n3\tb\n")
+    with patch.object(example_filetype_format, "CHUNKED_READ_SIZE", 0),\
+         patch.object(FILE_FORMAT, "_read_buffer_chunks") as patch_chunks:
+        FILE_FORMAT._get_dataframe(str(tsv))
+        patch_chunks.assert_not_called()
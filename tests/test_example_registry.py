@@ -0,0 +1,55 @@
+"""Tests example_registry"""
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from example_registry import csv
+
+
+@pytest.mark.parametrize(
+    "df",
+    [
+        pd.DataFrame({"A": [1, 2], "B": ["x", "y z"]}),
+        pd.DataFrame({"A": [1, 2], "B": ["x", None]}),
+        pd.DataFrame({"A": pd.array([1, None], dtype="Int64"), "B": ["", "y"]}),
+        pd.DataFrame({"A": [1, 2], "B": ["x", "y\tz"]}),
+        pd.DataFrame({"A": [1, 2], "B": ['x"', "y\nz"]}),
+        pd.DataFrame({"A": [1, 2], "B": ["x", 3]}),
+        pd.DataFrame({"A": [None, "x"]}),
+        pd.DataFrame({"A\tB": [1, 2], "C": [3, 4]}),
+        pd.DataFrame({"A": [True, False], "B": [1, 2]}),
+        pd.DataFrame({"A": [1.0, np.nan], "B": [1, 2]}),
+        pd.DataFrame({"A": pd.to_datetime(["2020-01-01", None]),
+                      "B": [1, 2]}),
+        pd.DataFrame({"A": [], "B": []}),
+    ],
+    ids=["ints_strings", "null_string", "nullable_int", "tab_value",
+         "quote_newline_values", "mixed_object", "one_column_null",
+         "tab_header", "bools", "floats", "timestamps", "empty"]
+)
+def test__write_tsv(tmp_path, df):
+    """Test tsvs are written exactly as DataFrame.to_csv writes them"""
+    path = tmp_path / "test.tsv"
+    expected_path = tmp_path / "expected.tsv"
+    csv._write_tsv(df, str(path))
+    df.to_csv(str(expected_path), sep="\t", index=False)
+    assert path.read_bytes() == expected_path.read_bytes()
+
+
+def test_arrow__write_tsv(tmp_path):
+    """Test integer and string frames are written by pyarrow"""
+    pytest.importorskip("pyarrow")
+    df = pd.DataFrame({"A": [1, 2], "B": ["x", "y z"]})
+    with patch.object(pd.DataFrame, "to_csv") as patch_to_csv:
+        csv._write_tsv(df, str(tmp_path / "test.tsv"))
+        patch_to_csv.assert_not_called()
+    assert (tmp_path / "test.tsv").read_text() == "A\tB\n1\tx\n2\ty z\n"
+
+
+def test__process():
+    """Test column names are uppercased"""
+    df = pd.DataFrame({"a": [1], "Bc": [2]})
+    df = csv.Csv(None, "SAGE")._process(df)
+    assert df.columns.tolist() == ["A", "BC"]
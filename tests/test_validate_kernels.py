@@ -0,0 +1,38 @@
+"""Tests _validate_kernels.py"""
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import synapseclient
+
+from synapsegenie import _validate_kernels, example_filetype_format
+
+syn = mock.create_autospec(synapseclient.Synapse)
+FILE_FORMAT = example_filetype_format.FileTypeFormat(syn, "SAGE")
+
+
+def test_valid_check_range():
+    """Test no values out of range"""
+    arr = np.array([1.0, np.nan, 5.0])
+    assert _validate_kernels.check_range(arr, 1, 5) == (-1, 0)
+
+
+def test_invalid_check_range():
+    """Test values out of range are found"""
+    arr = np.array([1.0, 6.0, np.nan, 0.0])
+    assert _validate_kernels.check_range(arr, 1, 5) == (1, 2)
+
+
+def test_check_missing():
+    """Test missing values are found"""
+    arr = np.array([1.0, np.nan, 5.0, np.nan])
+    assert _validate_kernels.check_missing(arr) == (1, 2)
+
+
+def test__run_kernel():
+    """Test kernels are run on nullable columns"""
+    df = pd.DataFrame({"foo": pd.array([1, None, 10], dtype="Int64")})
+    first, count = FILE_FORMAT._run_kernel(
+        df, "foo", _validate_kernels.check_range, 0, 5
+    )
+    assert (first, count) == (2, 1)